@@ -0,0 +1,67 @@
+"""
+Numba kernels for the fixed-width MEPS reader.
+Compiled eagerly (explicit signatures) and cached on disk so the LLVM compile is paid once.
+Kernels are single-threaded on purpose: run_batch_processing already runs one file per
+process, and Numba's threading layer does not survive the fork-based process pool.
+"""
+
+import os
+from pathlib import Path
+
+# Must be set before numba is imported; CI can persist this directory between runs.
+os.environ.setdefault(
+    "NUMBA_CACHE_DIR", str(Path(__file__).resolve().parents[2] / ".numba_cache")
+)
+
+import numpy as np
+from numba import njit, types
+
+# Rows are always an np.frombuffer view over the bytes read from the zip member,
+# i.e. a read-only C-contiguous (n_rows x record_len) uint8 matrix.
+_SIGNATURES = [
+    types.void(types.Array(types.uint8, 2, "C", readonly=True), types.int64, types.int64, types.float32[:]),
+]
+
+@njit(_SIGNATURES, cache=True)
+def parse_float_col(rows, start, end, out):
+    """
+    Parses the byte field rows[:, start:end] of every record into out (float32).
+    Accepts an optional sign, digits and one decimal point surrounded by blanks.
+    All-blank or malformed fields become NaN (same as pd.to_numeric(errors='coerce')).
+    """
+    for i in range(rows.shape[0]):
+        value = 0.0
+        scale = 1.0
+        sign = 1.0
+        seen_digit = False
+        seen_point = False
+        seen_sign = False
+        done = False  # trailing blanks reached
+        valid = True
+        for j in range(start, end):
+            c = rows[i, j]
+            if c == 32:  # ' '
+                if seen_digit or seen_point or seen_sign:
+                    done = True
+                continue
+            if done:
+                valid = False
+                break
+            if 48 <= c <= 57:  # '0'-'9'
+                seen_digit = True
+                value = value * 10.0 + (c - 48)
+                if seen_point:
+                    scale *= 10.0
+            elif c == 46 and not seen_point:  # '.'
+                seen_point = True
+            elif (c == 45 or c == 43) and not (seen_sign or seen_digit or seen_point):  # '-' / '+'
+                seen_sign = True
+                if c == 45:
+                    sign = -1.0
+            else:
+                valid = False
+                break
+        if valid and seen_digit:
+            out[i] = np.float32(sign * value / scale)
+        else:
+            out[i] = np.nan
@@ -4,10 +4,14 @@ Downloads ASCII (.dat) data files and SAS Programming Statements (.txt) from AHR
 """
 
 import requests
+import json
 import os
 import zipfile
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Configuration for Group 5 ---
 # MEPS Base URL patterns
@@ -48,23 +52,169 @@ FILES_TO_DOWNLOAD = {
 
 RAW_DIR = Path("data/raw")
 
-def download_url(url, dest_path):
-    if dest_path.exists():
-        print(f"Skipping {dest_path.name}, already exists.")
-        return True
+# ETag / Last-Modified validators per URL, so reruns revalidate instead of re-downloading
+HTTP_CACHE_FILE = RAW_DIR / ".http_cache.json"
+
+# Download concurrency
+# One pooled Session is shared by all worker threads so connections to the
+# AHRQ host are kept alive and reused instead of re-handshaking per file.
+MAX_WORKERS = 8
+MAX_PER_HOST = 4  # Cap on simultaneous requests to meps.ahrq.gov (be polite)
+REQUEST_TIMEOUT = (5, 30)  # (connect, read) seconds
+
+_host_slots = threading.BoundedSemaphore(MAX_PER_HOST)
+
+_http_cache = {}
+_http_cache_lock = threading.Lock()
+
+def load_http_cache():
+    if HTTP_CACHE_FILE.exists():
+        try:
+            with open(HTTP_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _http_cache.update(json.load(f))
+        except (ValueError, TypeError):  # JSONDecodeError is a ValueError; non-dict JSON fails update()
+            # Unreadable cache only costs a full re-download, so start empty
+            print(f"Ignoring corrupt {HTTP_CACHE_FILE.name}, starting with an empty cache.")
+
+def save_http_cache():
+    # Write to a temp file first so an interrupted save never leaves a truncated cache behind
+    tmp_path = HTTP_CACHE_FILE.with_name(HTTP_CACHE_FILE.name + ".part")
+    with _http_cache_lock:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_http_cache, f, indent=2)
+        tmp_path.replace(HTTP_CACHE_FILE)
+
+def make_session():
+    """Builds a requests.Session with a connection pool and retry/backoff on transient errors."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"]
+        )
+    )
+    session.mount("https://", adapter)
+    return session
+
+def download_url(session, url, dest_path):
+    """
+    Conditional GET: if dest_path exists and we hold validators for url, the server
+    can answer 304 Not Modified and the local copy is kept without transferring a body.
+    """
+    headers = {}
+    with _http_cache_lock:
+        cached = _http_cache.get(url) if dest_path.exists() else None
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
     
     print(f"Downloading {url}...")
+    # Write to a temp file first so an interrupted download never looks complete
+    tmp_path = dest_path.with_name(dest_path.name + ".part")
     try:
-        r = requests.get(url, stream=True)
-        r.raise_for_status()
-        with open(dest_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+        with _host_slots:
+            with session.get(url, stream=True, timeout=REQUEST_TIMEOUT, headers=headers) as r:
+                if r.status_code == 304:
+                    print(f"{dest_path.name} is up to date.")
+                    return True
+                r.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        f.write(chunk)
+                tmp_path.replace(dest_path)
+                validators = {
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified")
+                }
+        with _http_cache_lock:
+            _http_cache[url] = validators
         print(f"Saved to {dest_path}")
         return True
     except requests.exceptions.RequestException as e:
         print(f"Failed to download {url}: {e}")
         return False
+    finally:
+        # Never leave a partial download behind
+        tmp_path.unlink(missing_ok=True)
+
+def probe(session, url):
+    """Cheap existence check: HEAD the URL instead of streaming a full GET."""
+    try:
+        with _host_slots:
+            r = session.head(url, allow_redirects=True, timeout=5)
+        return r.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+def download_first(session, urls, dest_path):
+    """HEAD-probes candidate URLs in order and GETs only the first hit."""
+    # Revalidate against the URL this file came from last time, skipping discovery
+    if dest_path.exists():
+        with _http_cache_lock:
+            known = next((u for u in urls if u in _http_cache), None)
+        if known and download_url(session, known, dest_path):
+            return True
+
+    hit = next((u for u in urls if probe(session, u)), None)
+    if hit is not None and download_url(session, hit, dest_path):
+        return True
+
+    # Offline / server down: an existing local copy is still usable
+    if dest_path.exists():
+        print(f"Could not revalidate {dest_path.name}, keeping local copy.")
+        return True
+    return False
+
+def build_url_patterns(fid):
+    """Returns (zip_patterns, sas_patterns) candidate URLs for a MEPS file id."""
+    # 1. ASCII Data Zip
+    # Try both base URLs and common naming patterns
+    # Pattern 1: /hXXXdat.zip (Old style)
+    # Pattern 2: /hXXX/hXXXdat.zip (New style, inside folder)
+    zip_patterns = [
+        f"{BASE_URL_1}/{fid}dat.zip",
+        f"{BASE_URL_2}/{fid}/{fid}dat.zip",
+        f"{BASE_URL_1}/{fid}/{fid}dat.zip"
+    ]
+
+    # 2. SAS Programming Statements (The "Decoder Ring" for ASCII)
+    # Try multiple patterns because MEPS naming is inconsistent
+    # Priority 1: standard 'sp.txt' 
+    # Priority 2: 'su.txt' (older style)
+    # Priority 3: 'ssp' (sometimes no extension)
+    
+    # New robust logic: Check both Base URLs + Check Inside Subfolder + Check All Extensions
+    sas_patterns = []
+    extensions = ["sp.txt", "su.txt", ".ssp", ".sas", "stu.txt"]
+    
+    for ext in extensions:
+        # Root level
+        sas_patterns.append(f"{BASE_URL_1}/{fid}{ext}")
+        # Inside subfolder (Base 2 is usually structured /pufs/hXXX/hXXXsp.txt)
+        sas_patterns.append(f"{BASE_URL_2}/{fid}/{fid}{ext}")
+        sas_patterns.append(f"{BASE_URL_1}/{fid}/{fid}{ext}")
+
+    return zip_patterns, sas_patterns
+
+def ingest_file(session, fid):
+    """Downloads the data zip and SAS statements for a single file id."""
+    zip_patterns, sas_patterns = build_url_patterns(fid)
+
+    zip_dest = RAW_DIR / f"{fid}dat.zip"
+    if not download_first(session, zip_patterns, zip_dest):
+        print(f"ERROR: Could not find DATA ZIP for {fid}")
+        return # If no data, no point downloading SAS statements
+
+    # Always save as sp.txt locally for consistency so parser knows what to read
+    sas_dest = RAW_DIR / f"{fid}sp.txt"
+    if not download_first(session, sas_patterns, sas_dest):
+        print(f"WARNING: Could not find SAS statements for {fid}")
 
 def ingest_group_data():
     """Main ingestion logic."""
@@ -72,63 +222,18 @@ def ingest_group_data():
     
     all_files = FILES_TO_DOWNLOAD["longitudinal"] + FILES_TO_DOWNLOAD["events"]
     
-    for file_info in all_files:
-        fid = file_info["id"]
-        
-        # 1. Download ASCII Data Zip
-        # Try both base URLs and common naming patterns
-        # Pattern 1: /hXXXdat.zip (Old style)
-        # Pattern 2: /hXXX/hXXXdat.zip (New style, inside folder)
-        zip_patterns = [
-            f"{BASE_URL_1}/{fid}dat.zip",
-            f"{BASE_URL_2}/{fid}/{fid}dat.zip",
-            f"{BASE_URL_1}/{fid}/{fid}dat.zip"
-        ]
-        
-        zip_downloaded = False
-        zip_dest = RAW_DIR / f"{fid}dat.zip"
-        
-        for url in zip_patterns:
-            if download_url(url, zip_dest):
-                zip_downloaded = True
-                break
-        
-        if not zip_downloaded:
-            print(f"ERROR: Could not find DATA ZIP for {fid}")
-            continue # If no data, no point downloading SAS statements
-
-        # 2. Download SAS Programming Statements (The "Decoder Ring" for ASCII)
-        # Try multiple patterns because MEPS naming is inconsistent
-        # Priority 1: standard 'sp.txt' 
-        # Priority 2: 'su.txt' (older style)
-        # Priority 3: 'ssp' (sometimes no extension)
-        
-        success = False
-        
-        # New robust logic: Check both Base URLs + Check Inside Subfolder + Check All Extensions
-        sas_patterns = []
-        extensions = ["sp.txt", "su.txt", ".ssp", ".sas", "stu.txt"]
-        
-        for ext in extensions:
-            # Root level
-            sas_patterns.append(f"{BASE_URL_1}/{fid}{ext}")
-            # Inside subfolder (Base 2 is usually structured /pufs/hXXX/hXXXsp.txt)
-            sas_patterns.append(f"{BASE_URL_2}/{fid}/{fid}{ext}")
-            sas_patterns.append(f"{BASE_URL_1}/{fid}/{fid}{ext}")
-        
-        for url in sas_patterns:
-            # Always save as sp.txt locally for consistency so parser knows what to read
-            sas_dest = RAW_DIR / f"{fid}sp.txt" 
-            
-            if download_url(url, sas_dest):
-                success = True
-                break
-        
-        if not success:
-            print(f"WARNING: Could not find SAS statements for {fid}")
-        
-        # Small delay to be polite to the server
-        time.sleep(1)
+    load_http_cache()
+    
+    # File ids are independent, so fan them out across a thread pool.
+    # Per-host politeness is enforced by the semaphore in download_url.
+    try:
+        with make_session() as session:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+                futures = [ex.submit(ingest_file, session, f["id"]) for f in all_files]
+                for fut in futures:
+                    fut.result()
+    finally:
+        save_http_cache()
 
 if __name__ == "__main__":
     print(f"Starting ingestion for Group 5 (Panels 18-22)...")
@@ -0,0 +1,56 @@
+"""
+Column allow-lists for MEPS files.
+Only these variables are parsed out of the fixed-width .dat files; everything else is skipped
+at read time. Longitudinal columns mirror the candidates used in notebooks/2.0 (var_groups).
+"""
+
+# Longitudinal panel files (h172, h183, ...): identifiers, costs, utilization, demographics, conditions
+LONGITUDINAL_COLUMNS = {
+    # Identifiers & Weights
+    'DUPERSID', 'PANEL', 'LONGWT', 'PERWT',
+    # Outcomes
+    'TOTEXPY1', 'TOTEXPY2',
+    # Utilization
+    'ERTOTY1', 'RXTOTY1', 'IPDISY1', 'IPTOTY1', 'OPTOTVY1', 'OBTOTVY1',
+    # Cost Components
+    'IPTEXPY1', 'ERTEXPY1', 'OPTEXPY1', 'RXEXPY1',
+    # Demographics
+    'AGEY1X', 'AGE1X', 'AGEY2X', 'AGE2X', 'SEX',
+    'RACEV1X', 'RACEV2X', 'RACETHNX', 'MARRY1X', 'MARRYY1X',
+    # SES
+    'POVCATY1', 'POVCATY2', 'INSCOVY1', 'INSCOVY2',
+    # Health Status (Rounds)
+    'MNHLTH1', 'MNHLTH3', 'MNHLTH5', 'RTHLTH1', 'RTHLTH5',
+    # Risk Factors / Conditions
+    'DIABDXY1', 'DIABDX', 'HIBPDXY1', 'HIBPDX', 'CHOLDXY1', 'CHOLDX',
+    'CANCERY1', 'CANCERDX', 'BMINDX53',
+}
+
+# Medical Conditions files (h162, h170, ...): diagnosis codes for mental health flags
+CONDITION_COLUMNS = {
+    'DUPERSID', 'CONDIDX', 'PANEL',
+    'ICD9CODX', 'ICD10CDX', 'CCCODEX', 'CCSR1X', 'CCSR2X', 'CCSR3X',
+    'ERCOND', 'IPCOND', 'OPCOND', 'OBCOND', 'RXCOND',
+}
+
+# Prescribed Medicines files (h160a, h168a, ...): drug identity/class for opioid flags
+MEDS_COLUMNS = {
+    'DUPERSID', 'RXRECIDX', 'PANEL',
+    'RXNDC', 'RXNAME', 'RXDRGNAM', 'TC1', 'TC1S1', 'TC1S1_1', 'TC2', 'TC2S1',
+    'RXQUANTY', 'RXDAYSUP',
+} | {f'RXXP{yy}X' for yy in range(13, 19)}
+
+LONGITUDINAL_IDS = {'h172', 'h183', 'h193', 'h202', 'h209', 'h212'}
+CONDITION_IDS = {'h162', 'h170', 'h180', 'h190', 'h199', 'h207'}
+
+def columns_for_file(file_id):
+    """
+    Returns the allow-list for a MEPS file id, or None to keep every column.
+    """
+    if file_id in LONGITUDINAL_IDS:
+        return LONGITUDINAL_COLUMNS
+    if file_id in CONDITION_IDS:
+        return CONDITION_COLUMNS
+    if file_id.endswith('a'):  # hXXXa = Prescribed Medicines
+        return MEDS_COLUMNS
+    return None
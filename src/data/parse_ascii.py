@@ -4,15 +4,63 @@ Parses SAS Programming Statements (.txt) to extract column specifications (names
 Reads fixed-width .dat files and processes them into optimized Parquet format.
 """
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import hashlib
+import importlib.util
+import json
 import re
 import zipfile
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+try:
+    from .meps_columns import columns_for_file
+except ImportError:  # run as a script from src/data
+    from meps_columns import columns_for_file
+
+# Probe with find_spec rather than importing numba: _fwf_numba must set
+# NUMBA_CACHE_DIR before numba reads its config on first import.
+if importlib.util.find_spec('numba') is None:  # numba not installed -> pandas fallback in parse_numeric
+    parse_float_col = None
+else:
+    try:
+        from ._fwf_numba import parse_float_col
+    except ImportError:  # run as a script from src/data
+        from _fwf_numba import parse_float_col
+
+# Regex patterns (compiled once at import)
+# Matches: @1 DUPERSID $8.  or  @9 AGE13X 2.  or  @20 TOTEXP13 7.2
+# Group 1: Start Pos, Group 2: Var Name, Group 3: '$' (if char), Group 4: Length, Group 5: Decimals
+_INPUT_RE = re.compile(r'@(\d+)\s+([A-Z0-9_]+)\s+(\$?)(\d+)\.(\d*)')
+
+# Matches: DUPERSID = "PERSON ID (DUID + PID)"
+_LABEL_RE = re.compile(r'([A-Z0-9_]+)\s*=\s*"(.*)"')
+
+# Section boundaries: a line starting with INPUT / LABEL opens a section, a line starting with ';' closes it
+_SECTION_RE = re.compile(r'^[ \t]*(?:(INPUT|LABEL)(?=\s|$)|;)', re.MULTILINE)
+
+# Bump when the parser output changes so cached .meta.json files are invalidated
+_META_VERSION = b'4'
+
+# Integer fields up to this width (-999..9999) fit in a nullable Int16
+_MAX_INT16_WIDTH = 4
+
+# Parquet column type for each dtype string produced by the SAS parser
+_ARROW_TYPES = {
+    'str': pa.string(),
+    'float32': pa.float32(),
+    'Int16': pa.int16(),
+}
+
 def parse_sas_instructions(sas_file_path):
     """
     Parses a SAS input statement file to extract column names, widths/positions, and labels.
+    The result is cached next to the SAS file as {stem}.{hash}.meta.json, keyed by a hash
+    of the file content, so reruns skip the parse entirely.
     Args:
         sas_file_path (Path): Path to the .txt file containing SAS commands.
         
@@ -23,70 +71,83 @@ def parse_sas_instructions(sas_file_path):
             'dtypes': dictionary of {col_name: type_str}
             'labels': dictionary of {col_name: description}
     """
+    sas_file_path = Path(sas_file_path)
+    key = hashlib.blake2b(_META_VERSION + sas_file_path.read_bytes(), digest_size=16).hexdigest()
+    cache_path = sas_file_path.with_name(f"{sas_file_path.stem}.{key}.meta.json")
+
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            # JSON has no tuples
+            meta['colspecs'] = [tuple(spec) for spec in meta['colspecs']]
+            return meta
+        except (json.JSONDecodeError, KeyError):
+            print(f"  - Ignoring corrupt metadata cache {cache_path.name}, reparsing.")
+
+    meta = _parse_sas_file(sas_file_path)
+    # Write to a temp file first so an interrupted run never leaves a truncated cache behind
+    tmp_path = cache_path.with_name(cache_path.name + ".part")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    tmp_path.replace(cache_path)
+    return meta
+
+def _parse_sas_file(sas_file_path):
+    """
+    Uncached parse of the SAS INPUT / LABEL sections (see parse_sas_instructions).
+    """
     colspecs = []
     names = []
     dtypes = {}
     labels = {}
     
-    # Regex patterns
-    # Matches: @1 DUPERSID $8.  or  @9 AGE13X 2.
-    # Group 1: Start Pos, Group 2: Var Name, Group 3: '$' (if char), Group 4: Length
-    input_pattern = re.compile(r'@(\d+)\s+([A-Z0-9_]+)\s+(\$?)(\d+)\.')
-    
-    # Matches: DUPERSID = "PERSON ID (DUID + PID)"
-    label_pattern = re.compile(r'([A-Z0-9_]+)\s*=\s*"(.*)"')
-    
-    is_input_section = False
-    is_label_section = False
+    # SAS statement files are small (<1 MB): read once and sweep each section with finditer
+    text = Path(sas_file_path).read_text(encoding='latin1')
     
-    with open(sas_file_path, 'r', encoding='latin1') as f:
-        for line in f:
-            line = line.strip()
-            
-            # Detect Sections
-            if line.startswith('INPUT'):
-                is_input_section = True
-                is_label_section = False
-                continue
-            elif line.startswith('LABEL'):
-                is_label_section = True
-                is_input_section = False
-                continue
-            elif line.startswith(';'):
-                is_input_section = False
-                is_label_section = False
-                continue
-            
-            # Parse INPUT section
-            if is_input_section:
-                match = input_pattern.search(line)
-                if match:
-                    start_sas = int(match.group(1))
-                    var_name = match.group(2)
-                    is_char = (match.group(3) == '$')
-                    length = int(match.group(4))
-                    
-                    # Convert SAS 1-based start to Python 0-based start
-                    start_py = start_sas - 1
-                    end_py = start_py + length
-                    
-                    colspecs.append((start_py, end_py))
-                    names.append(var_name)
-                    
-                    # Store dtype preference
-                    if is_char:
-                        dtypes[var_name] = 'str'
-                    else:
-                        # We'll read as float first to handle NaNs, then downcast later if needed
-                        dtypes[var_name] = 'float32' 
-
-            # Parse LABEL section
-            if is_label_section:
-                match = label_pattern.search(line)
-                if match:
-                    var_name = match.group(1)
-                    desc = match.group(2)
-                    labels[var_name] = desc
+    bounds = list(_SECTION_RE.finditer(text))
+    for i, bound in enumerate(bounds):
+        section = bound.group(1)
+        if section is None:  # ';' terminator
+            continue
+        # Section body runs from the header keyword to the next boundary
+        # (so "INPUT @1 DUID 5." on the header line itself is picked up too)
+        body_start = bound.end()
+        body_end = bounds[i + 1].start() if i + 1 < len(bounds) else len(text)
+        
+        # Parse INPUT section
+        if section == 'INPUT':
+            for match in _INPUT_RE.finditer(text, body_start, body_end):
+                start_sas = int(match.group(1))
+                var_name = match.group(2)
+                is_char = (match.group(3) == '$')
+                length = int(match.group(4))
+                # MEPS writes integer fields as 'N.0', so only a non-zero decimal count means float
+                has_decimals = int(match.group(5) or 0) > 0
+                
+                # Convert SAS 1-based start to Python 0-based start
+                start_py = start_sas - 1
+                end_py = start_py + length
+                
+                colspecs.append((start_py, end_py))
+                names.append(var_name)
+                
+                # Store dtype preference
+                if is_char:
+                    dtypes[var_name] = 'str'
+                elif not has_decimals and length <= _MAX_INT16_WIDTH:
+                    # Short integer codes (-1/-8 missing markers, ages, flags, SEX/RACE codes);
+                    # use_dictionary=True already dictionary-encodes them on disk
+                    dtypes[var_name] = 'Int16'
+                else:
+                    dtypes[var_name] = 'float32'
+
+        # Parse LABEL section
+        else:
+            for match in _LABEL_RE.finditer(text, body_start, body_end):
+                var_name = match.group(1)
+                desc = match.group(2)
+                labels[var_name] = desc
 
     return {
         'colspecs': colspecs,
@@ -95,9 +156,134 @@ def parse_sas_instructions(sas_file_path):
         'labels': labels
     }
 
-def process_ascii_file(zip_path, sas_path, output_dir):
+# Rows per Parquet row group when streaming .dat -> Parquet
+CHUNK_ROWS = 100_000
+
+def _read_full(fh, n_bytes):
+    """
+    Reads exactly n_bytes from a stream (fewer only at EOF).
+    """
+    parts = []
+    while n_bytes > 0:
+        data = fh.read(n_bytes)
+        if not data:
+            break
+        parts.append(data)
+        n_bytes -= len(data)
+    return b''.join(parts)
+
+def parse_numeric(rows, start, end):
+    """
+    Parses the byte field rows[:, start:end] as float32 (NaN for blank / malformed values).
+    """
+    if parse_float_col is not None:
+        out = np.empty(len(rows), dtype=np.float32)
+        parse_float_col(rows, start, end, out)
+        return pd.Series(out)
+
+    values = decode_strings(rows, start, end)
+    return pd.to_numeric(values, errors='coerce', downcast='float').astype('float32')
+
+def decode_strings(rows, start, end):
+    """
+    Decodes the byte field rows[:, start:end] into stripped Python strings.
+    """
+    col_bytes = np.ascontiguousarray(rows[:, start:end]).view(f'S{end - start}').ravel()
+    return pd.Series(col_bytes).str.decode('latin1').str.strip()
+
+def decode_column(rows, start, end, dtype):
+    """
+    Converts the byte field rows[:, start:end] into a pandas Series of the requested type.
+    Numerics are produced directly in their declared (narrow) dtype instead of float64;
+    non-integer values in Int16 fields become missing.
+    """
+    if dtype == 'str':
+        values = decode_strings(rows, start, end)
+        # Blank character fields become missing, matching read_fwf behaviour
+        return values.where(values != '')
+
+    values = parse_numeric(rows, start, end)
+    if dtype == 'Int16':
+        # The Parquet schema is fixed per file, so a stray fractional value in a field
+        # declared as an integer ('N.0') is treated as malformed and becomes missing,
+        # like any other unparseable field, instead of aborting the whole dataset.
+        fractional = (values % 1).fillna(0) != 0
+        if fractional.any():
+            print(f"  - Warning: {int(fractional.sum())} non-integer value(s) in integer field at "
+                  f"columns {start + 1}-{end}; set to missing.")
+            values = values.mask(fractional)
+        return values.astype('Int16')
+    return values
+
+def iter_fixed_width(fh, meta, chunk_rows=CHUNK_ROWS):
+    """
+    Vectorised fixed-width reader over a binary stream (e.g. a zip member).
+    Reads chunk_rows records at a time as a (rows x record_len) byte matrix and slices
+    each column out in one operation instead of parsing the file line by line.
+    Yields DataFrames of at most chunk_rows rows so peak memory stays bounded.
+    """
+    # MEPS .dat files pad every record to the same width, so the first line
+    # gives the record length (including the CRLF / LF terminator).
+    pending = fh.readline()
+    if not pending:
+        return
+    if not pending.endswith(b'\n'):
+        raise ValueError("Could not find a line terminator in the .dat stream")
+    record_len = len(pending)
+    chunk_bytes = chunk_rows * record_len
+
+    while True:
+        data = pending + _read_full(fh, chunk_bytes - len(pending))
+        pending = b''
+        if not data:
+            break
+
+        eof = len(data) < chunk_bytes
+
+        # A partial record only occurs at EOF. Drop trailing blank lines (read_fwf skipped
+        # them too), then pad a real final record that lacks its newline with blanks so it
+        # slices like every other row.
+        if len(data) % record_len:
+            data = data.rstrip(b' \r\n')
+            short = len(data) % record_len
+            if short:
+                data += b' ' * (record_len - short)
+            if not data:
+                break
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, record_len)
+
+        columns = {}
+        for name, (start, end) in zip(meta['names'], meta['colspecs']):
+            columns[name] = decode_column(rows, start, end, meta['dtypes'][name])
+        yield pd.DataFrame(columns)
+
+        if eof:
+            break
+
+def arrow_schema(meta):
+    """
+    Builds the Parquet schema from the SAS metadata rather than inferring it per chunk,
+    so an all-blank column in the first chunk cannot pin the wrong type.
+    """
+    return pa.schema([(name, _ARROW_TYPES[meta['dtypes'][name]]) for name in meta['names']])
+
+def select_columns(meta, columns):
+    """
+    Restricts parsed SAS metadata to the given column names (projection pushdown).
+    """
+    keep = [i for i, name in enumerate(meta['names']) if name in columns]
+    names = [meta['names'][i] for i in keep]
+    return {
+        'colspecs': [meta['colspecs'][i] for i in keep],
+        'names': names,
+        'dtypes': {name: meta['dtypes'][name] for name in names},
+        'labels': {name: meta['labels'][name] for name in names if name in meta['labels']}
+    }
+
+def process_ascii_file(zip_path, sas_path, output_dir, columns=None):
     """
-    Full pipeline: Unzip .dat -> Parse SAS -> Read FWF -> Save Parquet -> Cleanup.
+    Full pipeline: Parse SAS -> Stream .dat from zip -> Slice fixed-width bytes -> Save Parquet.
+    If columns (a set of names) is given, only those fields are parsed and written.
     """
     zip_path = Path(zip_path)
     sas_path = Path(sas_path)
@@ -111,52 +297,51 @@ def process_ascii_file(zip_path, sas_path, output_dir):
     # 1. Parse Metadata
     print(f"  - Parsing SAS instructions from {sas_path.name}...")
     meta = parse_sas_instructions(sas_path)
+    if columns:
+        meta = select_columns(meta, columns)
+        print(f"  - Keeping {len(meta['names'])} of the requested {len(columns)} columns.")
     
-    # 2. Extract .dat file from zip
+    # 2. Stream .dat member straight out of the zip (nothing is extracted to disk)
+    out_file = output_dir / f"{file_id}.parquet"
     with zipfile.ZipFile(zip_path, 'r') as z:
         # Assuming only one .dat file inside, or finding the .dat
-        dat_filename = [n for n in z.namelist() if n.endswith('.dat') or n.endswith('.DAT')][0]
-        print(f"  - Extracting {dat_filename}...")
-        z.extract(dat_filename, path=zip_path.parent)
-        dat_path = zip_path.parent / dat_filename
-        
-    # 3. Read Fixed Width File (Chunks to convert to consistent types)
-    print(f"  - Reading ASCII data (this may take a while)...")
-    try:
-        # Read as string first to avoid parsing errors, then convert
-        df = pd.read_fwf(
-            dat_path, 
-            colspecs=meta['colspecs'], 
-            names=meta['names'],
-            header=None,
-            dtype=str  # Read all as string first to be safe
-        )
+        dat_filename = next(n for n in z.namelist() if n.lower().endswith('.dat'))
         
-        # Convert numeric columns
-        for col, dtype in meta['dtypes'].items():
-            if dtype == 'float32':
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # 3. Read Fixed Width File (Chunks to convert to consistent types)
+        print(f"  - Reading ASCII data from {dat_filename} (this may take a while)...")
+        with z.open(dat_filename) as fh:
+            # 4. Stream to Parquet one row group at a time (Preserve Schema)
+            # Store column labels in metadata (custom attribute is tricky in parquet, 
+            # so we often save a separate json or just rely on the codebook)
+            # Here we just save the data.
+            schema = arrow_schema(meta)
+            n_rows = 0
+            with pq.ParquetWriter(out_file, schema, compression='zstd', compression_level=3, use_dictionary=True) as writer:
+                for chunk in iter_fixed_width(fh, meta):
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                    n_rows += len(chunk)
                 
-        print(f"  - Loaded {len(df)} rows, {len(df.columns)} columns.")
+    print(f"  - Loaded {n_rows} rows, {len(schema)} columns.")
+    print(f"  - Saved to {out_file}")
 
-        # 4. Save to Parquet (Preserve Schema)
-        out_file = output_dir / f"{file_id}.parquet"
-        
-        # Store column labels in metadata (custom attribute is tricky in parquet, 
-        # so we often save a separate json or just rely on the codebook)
-        # Here we just save the data.
-        df.to_parquet(out_file, index=False)
-        print(f"  - Saved to {out_file}")
-        
-    finally:
-        # 5. Cleanup huge .dat file
-        if dat_path.exists():
-            os.remove(dat_path)
-            print(f"  - Cleaned up raw .dat file.")
+def _process_one(job):
+    """
+    Worker entry point for the process pool (must be module-level to be picklable).
+    Failures are reported and swallowed so one bad file does not abort the batch.
+    """
+    zip_file, sas_file, processed_dir, columns = job
+    file_id = sas_file.stem.replace('sp', '')
+    print(f"\n>>> Processing Batch: {file_id}")
+    try:
+        process_ascii_file(zip_file, sas_file, processed_dir, columns)
+        return True
+    except Exception as e:
+        print(f"ERROR processing {file_id}: {e}")
+        return False
 
 def run_batch_processing():
     """
-    Finds all matching pairs (zip + txt) in data/raw and processes them.
+    Finds all matching pairs (zip + txt) in data/raw and processes them in parallel.
     """
     raw_dir = Path("data/raw")
     processed_dir = Path("data/processed")
@@ -166,6 +351,7 @@ def run_batch_processing():
     
     print(f"Found {len(sas_files)} datasets to process.")
     
+    jobs = []
     for sas_file in sas_files:
         # Construct corresponding zip filename (e.g., h172sp.txt -> h172dat.zip)
         # Note: Sometimes pattern is slightly different (h172.dat or h172dat.zip)
@@ -177,11 +363,16 @@ def run_batch_processing():
             print(f"Warning: Data zip for {file_id} not found at {zip_file}. Skipping.")
             continue
             
-        print(f"\n>>> Processing Batch: {file_id}")
-        try:
-            process_ascii_file(zip_file, sas_file, processed_dir)
-        except Exception as e:
-            print(f"ERROR processing {file_id}: {e}")
+        jobs.append((zip_file, sas_file, processed_dir, columns_for_file(file_id)))
+
+    if not jobs:
+        return
+
+    # Each file is independent and parsing is CPU-bound, so fan out across cores.
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(jobs))) as ex:
+        results = list(ex.map(_process_one, jobs))
+
+    print(f"\nProcessed {sum(results)}/{len(jobs)} datasets successfully.")
 
 if __name__ == '__main__':
     run_batch_processing()
@@ -1,7 +1,15 @@
 import os
+import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import nbformat
+import nbconvert
 from nbconvert import HTMLExporter
-import markdown
+from markdown_it import MarkdownIt
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
 from pathlib import Path
 
 # Configuration
@@ -10,6 +18,38 @@ NOTEBOOKS_DIR = PROJ_ROOT / 'notebooks'
 REPORTS_DIR = PROJ_ROOT / 'reports'
 README_PATH = PROJ_ROOT / 'README.md'
 OUTPUT_FILE = REPORTS_DIR / 'full_project_report.html'
+CACHE_DIR = REPORTS_DIR / '.cache'  # Rendered notebook bodies, keyed by content hash
+# Body-only notebook markup; the notebook stylesheet is emitted once in the report <head>.
+# Traitlets must go to the constructor: setting template_name afterwards is ignored.
+NOTEBOOK_EXPORTER_OPTIONS = {
+    'template_name': 'basic',
+    'exclude_input_prompt': True,
+    'exclude_output_prompt': True,
+}
+# Full-page template whose <style> blocks provide the shared notebook CSS. The basic
+# template emits classic markup (output_area, inner_cell, rendered_html), so take
+# the stylesheet from 'classic'; the 'lab' CSS only targets jp-* classes.
+NOTEBOOK_CSS_TEMPLATE = 'classic'
+
+_STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL)
+
+def _highlight_code(code, lang, attrs):
+    # Only fenced blocks with a known language go through pygments; returning ""
+    # lets markdown-it fall back to its plain escaped <pre><code> block.
+    if not lang:
+        return ""
+    try:
+        lexer = get_lexer_by_name(lang)
+    except ClassNotFound:
+        return ""
+    return highlight(code, lexer, HtmlFormatter(nowrap=True))
+
+# CommonMark + raw HTML, tables and strikethrough (parity with python-markdown 'extra')
+md = (
+    MarkdownIt('commonmark', {'html': True, 'highlight': _highlight_code})
+    .enable('table')
+    .enable('strikethrough')
+)
 
 def convert_readme_to_html(path):
     if not path.exists():
@@ -19,27 +59,50 @@ def convert_readme_to_html(path):
         text = f.read()
     
     # Convert Markdown to HTML
-    html_content = markdown.markdown(text, extensions=['extra', 'codehilite'])
+    html_content = md.render(text)
     return f"<div class='readme-section'>{html_content}</div>"
 
 def convert_notebook_to_html(path):
-    print(f"Processing notebook: {path.name}...")
-    with open(path, 'r', encoding='utf-8') as f:
-        nb = nbformat.read(f, as_version=4)
-    
-    # Use HTMLExporter with basic template to avoid full <html><html> nesting
-    html_exporter = HTMLExporter()
-    html_exporter.template_name = 'classic' # or 'lab'
-    
-    # We want to embed this, so we might need to strip some parts or use BasicHTMLExporter
-    # But HTMLExporter gives better styling. We'll extract the body content later if needed.
-    # For simplicity in this script, we'll keep the styling but wrap it in a div.
-    
-    (body, resources) = html_exporter.from_notebook_node(nb)
+    # Cache key covers the notebook bytes, the nbconvert version and the exporter options (all change the output)
+    raw = path.read_bytes()
+    key = hashlib.blake2b(
+        raw + nbconvert.__version__.encode() + repr(sorted(NOTEBOOK_EXPORTER_OPTIONS.items())).encode(),
+        digest_size=16
+    ).hexdigest()
+    cache_file = CACHE_DIR / f"{key}.html"
+
+    if cache_file.exists():
+        print(f"Using cached render for notebook: {path.name}")
+        body = cache_file.read_text(encoding='utf-8')
+    else:
+        print(f"Processing notebook: {path.name}...")
+        nb = nbformat.reads(raw.decode('utf-8'), as_version=4)
+        
+        # Use HTMLExporter with basic template to avoid full <html><html> nesting
+        # and a copy of the notebook CSS/MathJax per notebook
+        html_exporter = HTMLExporter(**NOTEBOOK_EXPORTER_OPTIONS)
+        
+        (body, resources) = html_exporter.from_notebook_node(nb)
+        # Write to a temp file first so an interrupted run never leaves a truncated entry behind
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.part")
+        tmp_file.write_text(body, encoding='utf-8')
+        tmp_file.replace(cache_file)
+
     return f"<div class='notebook-section' id='{path.stem}'><h2>Notebook: {path.name}</h2><hr>{body}</div>"
 
+def notebook_stylesheet():
+    """
+    Returns the nbconvert notebook CSS (layout, outputs, dataframe tables, ANSI colours)
+    by rendering an empty notebook with the full-page template and keeping its <style> blocks.
+    """
+    html_exporter = HTMLExporter(template_name=NOTEBOOK_CSS_TEMPLATE)
+    (page, resources) = html_exporter.from_notebook_node(nbformat.v4.new_notebook())
+    head = page.split('</head>', 1)[0]
+    return "\n".join(_STYLE_RE.findall(head))
+
 def generate_report():
     print("Starting Report Generation...")
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
     
     # 1. Header & CSS
     html_head = """
@@ -47,6 +110,7 @@ def generate_report():
     <html>
     <head>
         <title>Healthcare Risk Analytics Project Report</title>
+        {notebook_css}
         <style>
             body { font-family: 'Segoe UI', Arial, sans-serif; margin: 0; padding: 0; background-color: #f5f5f5; }
             .container { max-width: 1200px; margin: 0 auto; background: white; padding: 40px; box-shadow: 0 0 10px rgba(0,0,0,0.1); }
@@ -59,6 +123,7 @@ def generate_report():
             pre { background: #f8f9fa; padding: 15px; border-radius: 4px; overflow-x: auto; }
             h1, h2, h3 { color: #2c3e50; }
             img { max-width: 100%; height: auto; }
+            {highlight_css}
         </style>
     </head>
     <body>
@@ -66,27 +131,36 @@ def generate_report():
         <h1>Healthcare Latent Risk Project - Full Report</h1>
         <p>Generated automatically from source repository.</p>
     """
+    # Notebook stylesheet and syntax-highlighting styles, shared by every notebook and README code fence
+    html_head = html_head.replace(
+        "{highlight_css}", HtmlFormatter().get_style_defs(['.highlight', '.readme-section pre code'])
+    ).replace("{notebook_css}", notebook_stylesheet())
 
     # 2. Table of Contents
-    toc_html = "<div class='toc'><h3>Table of Contents</h3><ul>"
-    toc_html += "<li><a href='#readme'>1. Project Overview (README)</a></li>"
-    
     notebooks = sorted([p for p in NOTEBOOKS_DIR.glob('*.ipynb') if not p.name.startswith('.')])
-    for i, nb in enumerate(notebooks):
-        toc_html += f"<li><a href='#{nb.stem}'>{i+2}. {nb.name}</a></li>"
-    toc_html += "</ul></div>"
-
-    content_html = ""
+    toc_items = [f"<li><a href='#{nb.stem}'>{i+2}. {nb.name}</a></li>" for i, nb in enumerate(notebooks)]
+    toc_html = "".join([
+        "<div class='toc'><h3>Table of Contents</h3><ul>",
+        "<li><a href='#readme'>1. Project Overview (README)</a></li>",
+        *toc_items,
+        "</ul></div>",
+    ])
 
     # 3. Add README
+    # Accumulate parts in a list and join once at the end (no quadratic string copies)
     print("Converting README...")
-    content_html += "<div id='readme'><h2>1. Project Overview</h2>"
-    content_html += convert_readme_to_html(README_PATH)
-    content_html += "</div>"
+    parts = [
+        html_head,
+        toc_html,
+        "<div id='readme'><h2>1. Project Overview</h2>",
+        convert_readme_to_html(README_PATH),
+        "</div>",
+    ]
 
-    # 4. Add Notebooks
-    for nb in notebooks:
-        content_html += convert_notebook_to_html(nb)
+    # 4. Add Notebooks (rendered in parallel; each worker builds its own HTMLExporter)
+    if notebooks:
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(notebooks))) as ex:
+            parts.extend(ex.map(convert_notebook_to_html, notebooks))
 
     # 5. Footer
     html_foot = """
@@ -98,7 +172,7 @@ def generate_report():
     # Write File
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        f.write(html_head + toc_html + content_html + html_foot)
+        f.write("".join(parts + [html_foot]))
     
     print(f"Report generated successfully at: {OUTPUT_FILE}")
 